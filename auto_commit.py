@@ -8,6 +8,9 @@ import requests
 import json
 import sys
 import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 # Импортируем конфигурацию
 try:
@@ -24,6 +27,43 @@ except ImportError:
     TIMEOUT = 30
     MAX_DIFF_SIZE = 2000
 
+# Новые настройки читаем отдельно, чтобы старый config.py без них
+# не сбрасывал настройки LM Studio к значениям по умолчанию
+try:
+    import config as _config
+except ImportError:
+    _config = None
+CANDIDATES_COUNT = getattr(_config, "CANDIDATES_COUNT", 4)  # Сколько вариантов сообщения запрашивать
+PUSH_RETRIES = getattr(_config, "PUSH_RETRIES", 3)  # Попыток push на каждый remote
+PUSH_BACKOFF = getattr(_config, "PUSH_BACKOFF", 2)  # Начальная пауза между попытками, секунды
+
+# Файлы со статусом и логом фоновой отправки (лежат в .git)
+PUSH_STATUS_FILE = "auto_commit_push.json"
+PUSH_LOG_FILE = "auto_commit_push.log"
+
+# Признаки временных сетевых ошибок, после которых стоит повторить push
+TRANSIENT_PUSH_ERRORS = ['could not resolve host', 'timed out', 'timeout',
+                         'connection reset', 'connection refused',
+                         'remote end hung up', 'early eof', 'temporary failure',
+                         'http 5', 'the requested url returned error: 5']
+
+# Частые глаголы начала сообщения (быстрая проверка)
+COMMIT_VERBS = ['добавил', 'исправил', 'обновил', 'удалил', 'создал', 'изменил',
+                'переименовал', 'улучшил', 'убрал', 'перенес', 'перенёс']
+
+# Глагол прошедшего времени (Настроил, Нашёл, Оптимизировала, Починились)
+# или краткое причастие (Добавлена, Исправлено, Обновлены)
+PAST_VERB_RE = re.compile(r'^[а-яё]+[аеёиоуыюя]л(а|о|и|ся|ась|ось|ись)?$')
+PARTICIPLE_RE = re.compile(r'^[а-яё]{4,}(ан|ян|ен|ён)(а|о|ы)?$')
+
+# Оценка, начиная с которой кандидат годится без дополнительных запросов
+GOOD_CANDIDATE_SCORE = 15
+
+# Признаки того, что модель выдала рассуждения вместо сообщения
+REASONING_MARKERS = ['think', 'let me', 'the user', 'user wants', 'okay',
+                     'думаю', 'итак,', 'хорошо,', 'сообщение коммита',
+                     'commit message', 'предлагаю']
+
 def run_git_command(command, show_output=False, args_list=None):
     """Выполнить git команду и вернуть результат"""
     try:
@@ -129,8 +169,11 @@ def get_changed_files_summary():
     
     return '\n'.join(summary_parts), file_types
 
-def clean_commit_message(message):
-    """Очистить сообщение коммита от лишнего текста"""
+def clean_commit_message(message, max_length=50):
+    """Очистить сообщение коммита от лишнего текста
+    
+    max_length=None оставляет длину как есть (нужно для оценки кандидатов).
+    """
     if not message:
         return message
     
@@ -232,8 +275,8 @@ def clean_commit_message(message):
     message = message.strip()
     
     # Ограничиваем длину
-    if len(message) > 50:
-        message = message[:47] + '...'
+    if max_length and len(message) > max_length:
+        message = message[:max_length - 3] + '...'
     
     # Убираем точку в конце
     message = message.rstrip('.')
@@ -244,6 +287,202 @@ def clean_commit_message(message):
     
     return message
 
+def starts_with_past_verb(message_lower):
+    """Проверить, что сообщение начинается с глагола в прошедшем времени"""
+    if any(message_lower.startswith(verb) for verb in COMMIT_VERBS):
+        return True
+    words = message_lower.split()
+    if not words:
+        return False
+    first_word = words[0].strip('.,:;!')
+    return bool(PAST_VERB_RE.match(first_word) or PARTICIPLE_RE.match(first_word))
+
+def score_commit_message(message, analysis=None):
+    """Оценить кандидата в сообщения коммита (чем больше, тем лучше)"""
+    if not message:
+        return 0
+    
+    score = 0
+    message_lower = message.lower()
+    
+    # Начинается с русского глагола в прошедшем времени
+    if starts_with_past_verb(message_lower):
+        score += 10
+    
+    # Длина: в пределах 50 символов, иначе сообщение придется обрезать
+    if len(message) <= 50:
+        score += 5
+    else:
+        score -= 5
+    if len(message.split()) >= 2:
+        score += 2
+    
+    # Следы рассуждений модели (как в clean_commit_message - по началу строки)
+    if any(message_lower.startswith(marker) for marker in REASONING_MARKERS):
+        score -= 10
+    
+    # Совпадение с именами из анализа diff
+    if analysis:
+        symbols = (analysis.get('functions_added', []) +
+                   analysis.get('functions_removed', []) +
+                   analysis.get('classes_added', []) +
+                   [os.path.basename(f) for f in analysis.get('files_changed', [])])
+        if any(symbol and symbol.lower() in message_lower for symbol in symbols):
+            score += 3
+    
+    return score
+
+def pick_best_commit_message(candidates, analysis=None):
+    """Очистить кандидатов и выбрать лучший по локальной оценке"""
+    best_message = None
+    best_score = 0
+    
+    for candidate in candidates:
+        # Оцениваем полную длину, обрезаем только победителя
+        cleaned = clean_commit_message(candidate, max_length=None)
+        score = score_commit_message(cleaned, analysis)
+        if score > best_score:
+            best_message = cleaned
+            best_score = score
+    
+    # Обрезаем так же, как обычное сообщение
+    if best_message and len(best_message) > 50:
+        best_message = clean_commit_message(best_message)
+    return best_message
+
+def request_commit_candidates(messages, count, analysis=None):
+    """Запросить у LM Studio count вариантов сообщения коммита
+    
+    Сначала просим все варианты одним запросом (параметр n). Если сервер
+    n не поддерживает (LM Studio его игнорирует) и полученный вариант
+    уже хорош, обходимся одним запросом; иначе недостающие варианты
+    дозапрашиваем параллельно.
+    """
+    def post(n):
+        response = requests.post(
+            LM_STUDIO_URL,
+            json={
+                "model": LM_STUDIO_MODEL,
+                "messages": messages,
+                "max_tokens": MAX_TOKENS,
+                "temperature": TEMPERATURE,
+                "n": n
+            },
+            timeout=TIMEOUT
+        )
+        if response.status_code != 200:
+            print(f"Ошибка LM Studio API: {response.status_code}")
+            return None
+        return [choice['message']['content'].strip() for choice in response.json()['choices']]
+    
+    candidates = post(count)
+    if candidates is None:
+        return None
+    
+    best_score = max((score_commit_message(clean_commit_message(candidate, max_length=None), analysis)
+                      for candidate in candidates), default=0)
+    missing = count - len(candidates)
+    if missing > 0 and best_score < GOOD_CANDIDATE_SCORE:
+        print(f"⚠️ Сервер не поддерживает n, дозапрашиваю {missing} вариантов параллельно")
+        with ThreadPoolExecutor(max_workers=missing) as executor:
+            futures = [executor.submit(post, 1) for _ in range(missing)]
+            for future in futures:
+                try:
+                    candidates.extend(future.result() or [])
+                except requests.exceptions.RequestException as e:
+                    print(f"Ошибка подключения к LM Studio: {e}")
+    
+    return candidates
+
+def get_remotes():
+    """Получить список настроенных удаленных репозиториев"""
+    remotes = run_git_command("git remote")
+    if not remotes:
+        return []
+    return [remote.strip() for remote in remotes.split('\n') if remote.strip()]
+
+def get_push_status_path(filename=PUSH_STATUS_FILE):
+    """Путь к файлу статуса (или лога) фоновой отправки"""
+    git_dir = run_git_command("git rev-parse --git-dir") or ".git"
+    return os.path.join(git_dir, filename)
+
+def make_push_status(branch, remotes):
+    """Начальный статус отправки: все remotes в ожидании"""
+    return {
+        'branch': branch,
+        'started': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'finished': None,
+        'remotes': {remote: {'ok': None} for remote in remotes}
+    }
+
+def write_push_status(status):
+    """Записать статус отправки в файл"""
+    path = get_push_status_path()
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(status, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+def push_to_remote(remote, branch):
+    """Отправить ветку на один remote с повтором при временных ошибках"""
+    delay = PUSH_BACKOFF
+    error = ""
+    
+    for attempt in range(1, PUSH_RETRIES + 1):
+        result = subprocess.run(
+            ["git", "push", remote, branch],
+            capture_output=True,
+            text=True
+        )
+        if result.returncode == 0:
+            return {'ok': True, 'attempts': attempt, 'error': ""}
+        
+        error = result.stderr.strip()
+        # Отказ сервера или проблемы с доступом повтором не исправить
+        if not any(marker in error.lower() for marker in TRANSIENT_PUSH_ERRORS):
+            break
+        if attempt < PUSH_RETRIES:
+            time.sleep(delay)
+            delay *= 2
+    
+    return {'ok': False, 'attempts': attempt, 'error': error}
+
+def push_all_remotes(branch):
+    """Параллельно отправить ветку на все remotes и записать статус"""
+    remotes = get_remotes()
+    status = make_push_status(branch, remotes)
+    write_push_status(status)
+    
+    if remotes:
+        with ThreadPoolExecutor(max_workers=len(remotes)) as executor:
+            results = executor.map(lambda remote: push_to_remote(remote, branch), remotes)
+            for remote, result in zip(remotes, results):
+                status['remotes'][remote] = result
+    
+    status['finished'] = time.strftime('%Y-%m-%d %H:%M:%S')
+    write_push_status(status)
+    return status
+
+def start_background_push(branch, remotes):
+    """Запустить отправку во всех remotes в отдельном процессе"""
+    # Сбрасываем статус прошлого запуска до старта фонового процесса
+    write_push_status(make_push_status(branch, remotes))
+    
+    # Без терминала git не должен ждать ввода логина и пароля
+    env = dict(os.environ, GIT_TERMINAL_PROMPT="0")
+    
+    with open(get_push_status_path(PUSH_LOG_FILE), 'a', encoding='utf-8') as log:
+        log.write(f"--- {time.strftime('%Y-%m-%d %H:%M:%S')} push {branch}\n")
+        log.flush()
+        subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "--push", branch],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=log,
+            env=env,
+            start_new_session=True
+        )
+
 def analyze_file_content_changes(diff_content):
     """Анализировать содержимое изменений в файлах"""
     if not diff_content:
@@ -508,8 +747,12 @@ def generate_fallback_commit_message(file_types, diff_content):
     # Общий fallback
     return "Обновил код"
 
-def generate_commit_message(diff_content, status_content, files_info=None):
-    """Генерировать сообщение коммита через LM Studio"""
+def generate_commit_message(diff_content, status_content, files_info=None, analysis=None):
+    """Генерировать сообщение коммита через LM Studio
+    
+    Просим у модели несколько вариантов (request_commit_candidates)
+    и выбираем лучший локальной оценкой score_commit_message().
+    """
     
     # Получаем краткое описание файлов
     files_summary, file_types = get_changed_files_summary()
@@ -547,41 +790,30 @@ Diff (первые символы):
 Отвечай ТОЛЬКО сообщением коммита:
 """
 
+    messages = [
+        {
+            "role": "system",
+            "content": "Ты генератор git коммитов. Отвечай СТРОГО ТОЛЬКО сообщением коммита на русском языке. Начинай с глагола (Добавил/Исправил/Обновил/Удалил). Максимум 50 символов. Никаких объяснений, предисловий или комментариев."
+        },
+        {
+            "role": "user",
+            "content": prompt
+        }
+    ]
+
     try:
-        response = requests.post(
-            LM_STUDIO_URL,
-            json={
-                "model": LM_STUDIO_MODEL,
-                "messages": [
-                    {
-                        "role": "system",
-                        "content": "Ты генератор git коммитов. Отвечай СТРОГО ТОЛЬКО сообщением коммита на русском языке. Начинай с глагола (Добавил/Исправил/Обновил/Удалил). Максимум 50 символов. Никаких объяснений, предисловий или комментариев."
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                "max_tokens": MAX_TOKENS,
-                "temperature": TEMPERATURE
-            },
-            timeout=TIMEOUT
-        )
+        candidates = request_commit_candidates(messages, CANDIDATES_COUNT, analysis)
         
-        if response.status_code == 200:
-            result = response.json()
-            message = result['choices'][0]['message']['content'].strip()
+        if candidates is not None:
+            # Очищаем варианты и выбираем лучший
+            cleaned_message = pick_best_commit_message(candidates, analysis)
             
-            # Очищаем ответ
-            cleaned_message = clean_commit_message(message)
-            
-            # Если очистка не дала результата, используем fallback
+            # Если ни один вариант не подошел, используем fallback
             if not cleaned_message:
                 return generate_fallback_commit_message(file_types, diff_content)
             
             return cleaned_message
         else:
-            print(f"Ошибка LM Studio API: {response.status_code}")
             return None
             
     except requests.exceptions.RequestException as e:
@@ -629,7 +861,7 @@ def main():
     else:
         # Если умный анализ не дал результата, пробуем LM Studio
         print("🤖 Генерирую сообщение через LM Studio...")
-        commit_message = generate_commit_message(diff, status, files_info)
+        commit_message = generate_commit_message(diff, status, files_info, content_analysis)
         
         if not commit_message:
             print("❌ Не удалось сгенерировать сообщение коммита")
@@ -661,34 +893,24 @@ def main():
         # Спрашиваем про push
         push_confirm = input("🚀 Отправить на удаленный репозиторий? (y/n): ").lower().strip()
         if push_confirm in ['y', 'yes', 'д', 'да', '']:
-            # Пробуем разные варианты push
             current_branch = run_git_command("git branch --show-current")
+            remotes = get_remotes()
             
-            if current_branch:
-                print(f"📤 Отправляю ветку '{current_branch}'...")
-                # Сначала пробуем git push origin current_branch
-                push_result = run_git_command(f"git push origin {current_branch}", show_output=True)
-                
-                if push_result is not None:
-                    print("🎉 Изменения успешно отправлены!")
-                else:
-                    print("⚠️ Ошибка с указанием ветки, пробую простой push...")
-                    # Пробуем простой git push
-                    push_result = run_git_command("git push", show_output=True)
-                    
-                    if push_result is not None:
-                        print("🎉 Изменения успешно отправлены!")
-                    else:
-                        print("❌ Ошибка при отправке изменений")
-                        print("💡 Возможные причины:")
-                        print("   - Нет настроенного удаленного репозитория")
-                        print("   - Нет прав доступа")
-                        print("   - Проблемы с SSH ключами")
-                        print("   - Нужно сначала сделать 'git push --set-upstream origin main'")
-            else:
+            if not current_branch:
                 print("❌ Не удалось определить текущую ветку")
+            elif not remotes:
+                print("❌ Нет настроенного удаленного репозитория")
+            else:
+                print(f"📤 Отправляю ветку '{current_branch}' в фоне: {', '.join(remotes)}")
+                start_background_push(current_branch, remotes)
+                print(f"💡 Статус отправки: {get_push_status_path()}")
+                print(f"💡 Лог ошибок: {get_push_status_path(PUSH_LOG_FILE)}")
     else:
         print("❌ Ошибка создания коммита")
 
 if __name__ == "__main__":
-    main()
+    # Фоновый режим: auto_commit.py --push <ветка>
+    if len(sys.argv) == 3 and sys.argv[1] == "--push":
+        push_all_remotes(sys.argv[2])
+    else:
+        main()
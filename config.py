@@ -11,8 +11,29 @@ MODEL_CONFIG = {
     },
     "temperature": 0.5,
     "max_tokens": 1024,
+    "retries": 2,  # Повторы при 429 и ошибках сервера 5xx
+    "max_retry_wait": 10,  # Больше ждать Retry-After не будем, секунды
     "use_mock": False  # Set to False to use the real API
 }
 
 # Системный промт
 SYSTEM_PROMPT = ""
+
+# Настройки голосового вывода (потоковая озвучка ответа)
+VOICE_CONFIG = {
+    "queue_size": 8,  # Сколько фрагментов может ждать синтеза
+    "min_clause_length": 60,  # Резать по запятым только если фрагмент длиннее
+    "max_chunk_length": 200,  # Принудительный разрез слишком длинного фрагмента
+    "sample_rate": 16000  # Частота дискретизации для WAV
+}
+
+# Настройки локального сервера ассистента (server.py)
+SERVER_CONFIG = {
+    "host": "127.0.0.1",
+    "port": 8765,
+    "workers": 4,  # Одновременных запросов к модели
+    "per_client_limit": 2,  # Одновременных запросов от одного клиента
+    "batch_size": 1,  # >1 включает микробатчинг, если бэкенд его поддерживает
+    "batch_wait": 0.02,  # Сколько ждать добора батча, секунды
+    "priorities": {"voice": 0, "interactive": 1, "background": 2}
+}
@@ -0,0 +1,87 @@
+# loadtest.py
+"""
+Нагрузочный тест server.py на mock-бэкенде.
+Пример: python loadtest.py --requests 500 --clients 20 --batch 8
+"""
+import json
+import time
+import random
+import asyncio
+import argparse
+from server import AssistantServer
+
+def make_mock_backend(latency):
+    """Mock-модель: отвечает эхом с фиксированной задержкой"""
+    def backend(query):
+        time.sleep(latency)
+        return f"Ответ: {query}"
+
+    def batch_backend(queries):
+        # Батч стоит чуть дороже одиночного запроса, но много дешевле суммы
+        time.sleep(latency * (1 + 0.1 * len(queries)))
+        return [f"Ответ: {query}" for query in queries]
+
+    return backend, batch_backend
+
+async def send_request(port, query, priority, client_id):
+    """Отправить POST /ask и вернуть время ответа"""
+    started = time.perf_counter()
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    body = json.dumps({"query": query, "priority": priority}).encode("utf-8")
+    writer.write(
+        f"POST /ask HTTP/1.1\r\nHost: localhost\r\nX-Client-Id: {client_id}\r\n"
+        f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n".encode("latin-1") + body
+    )
+    await writer.drain()
+    await reader.read()
+    writer.close()
+    return time.perf_counter() - started
+
+def percentile(values, p):
+    """Перцентиль по отсортированному списку"""
+    index = min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))
+    return values[index]
+
+async def run(args):
+    backend, batch_backend = make_mock_backend(args.latency)
+    assistant = AssistantServer(
+        backend=backend,
+        batch_backend=batch_backend if args.batch > 1 else None,
+        config={"port": 0, "workers": args.workers, "batch_size": args.batch}
+    )
+    server = await assistant.start()
+    port = server.sockets[0].getsockname()[1]
+
+    # Часть запросов повторяется, чтобы проверить объединение одинаковых
+    queries = [f"вопрос {random.randrange(int(args.requests * (1 - args.duplicates)) or 1)}"
+               for _ in range(args.requests)]
+    priorities = random.choices(["voice", "interactive", "background"], k=args.requests)
+    latencies = {"voice": [], "interactive": [], "background": []}
+
+    async def client(client_index):
+        for i in range(client_index, args.requests, args.clients):
+            latency = await send_request(port, queries[i], priorities[i], f"client-{client_index}")
+            latencies[priorities[i]].append(latency)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client(i) for i in range(args.clients)))
+    elapsed = time.perf_counter() - started
+    await assistant.stop()
+
+    print(f"Запросов: {args.requests}, клиентов: {args.clients}, батч: {args.batch}")
+    print(f"Пропускная способность: {args.requests / elapsed:.1f} запросов/с")
+    for priority, values in latencies.items():
+        if values:
+            values.sort()
+            print(f"{priority:12} p50={percentile(values, 50) * 1000:7.1f} мс  "
+                  f"p99={percentile(values, 99) * 1000:7.1f} мс  n={len(values)}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Нагрузочный тест сервера ассистента")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--clients", type=int, default=10)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--batch", type=int, default=1)
+    parser.add_argument("--latency", type=float, default=0.05, help="Задержка mock-модели, с")
+    parser.add_argument("--duplicates", type=float, default=0.2, help="Доля повторяющихся запросов")
+    asyncio.run(run(parser.parse_args()))
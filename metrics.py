@@ -0,0 +1,121 @@
+# metrics.py
+"""
+Метрики клиента OpenRouter: токены, задержки, повторы и лимиты запросов.
+Хранятся в памяти процесса, выгружаются в формате Prometheus или JSON.
+"""
+import json
+import threading
+
+# Границы корзин гистограмм, секунды
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60)
+
+class Histogram:
+    """Гистограмма с накопительными корзинами, как в Prometheus"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+    def snapshot(self):
+        return {
+            "buckets": {str(bound): count for bound, count in zip(self.buckets, self.counts)},
+            "count": self.count,
+            "sum": self.sum
+        }
+
+class ClientMetrics:
+    """Метрики запросов к модели с разбивкой по моделям"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.models = {}
+
+    def _model(self, model):
+        if model not in self.models:
+            self.models[model] = {
+                "requests": 0,
+                "errors": 0,
+                "retries": 0,
+                "prompt_tokens": 0,
+                "completion_tokens": 0,
+                "ttfb": Histogram(),
+                "latency": Histogram(),
+                "rate_limit": {}
+            }
+        return self.models[model]
+
+    def record(self, result):
+        """Учесть результат запроса (объект AIResult из text.py)"""
+        with self.lock:
+            stats = self._model(result.model)
+            stats["requests"] += 1
+            stats["retries"] += result.retries
+            if result.error:
+                stats["errors"] += 1
+            stats["prompt_tokens"] += result.prompt_tokens
+            stats["completion_tokens"] += result.completion_tokens
+            if result.ttfb is not None:
+                stats["ttfb"].observe(result.ttfb)
+            stats["latency"].observe(result.latency)
+            stats["rate_limit"].update(result.rate_limit)
+
+    def snapshot(self):
+        """Снимок всех метрик в виде словаря"""
+        with self.lock:
+            return {
+                model: {
+                    key: value.snapshot() if isinstance(value, Histogram) else
+                         dict(value) if isinstance(value, dict) else value
+                    for key, value in stats.items()
+                }
+                for model, stats in self.models.items()
+            }
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), ensure_ascii=False, indent=2)
+
+    def to_prometheus(self):
+        """Метрики в текстовом формате Prometheus"""
+        lines = []
+        counters = ("requests", "errors", "retries", "prompt_tokens", "completion_tokens")
+        snapshot = self.snapshot()
+
+        for name in counters:
+            lines.append(f"# TYPE openrouter_{name}_total counter")
+            for model, stats in snapshot.items():
+                lines.append(f'openrouter_{name}_total{{model="{model}"}} {stats[name]}')
+
+        for name in ("ttfb", "latency"):
+            lines.append(f"# TYPE openrouter_{name}_seconds histogram")
+            for model, stats in snapshot.items():
+                histogram = stats[name]
+                for bound, count in histogram["buckets"].items():
+                    lines.append(f'openrouter_{name}_seconds_bucket{{model="{model}",le="{bound}"}} {count}')
+                lines.append(f'openrouter_{name}_seconds_bucket{{model="{model}",le="+Inf"}} {histogram["count"]}')
+                lines.append(f'openrouter_{name}_seconds_sum{{model="{model}"}} {histogram["sum"]}')
+                lines.append(f'openrouter_{name}_seconds_count{{model="{model}"}} {histogram["count"]}')
+
+        lines.append("# TYPE openrouter_rate_limit gauge")
+        for model, stats in snapshot.items():
+            for header, value in stats["rate_limit"].items():
+                lines.append(f'openrouter_rate_limit{{model="{model}",header="{header}"}} {value}')
+
+        return "\n".join(lines) + "\n"
+
+    def export(self, path):
+        """Записать метрики в файл: .json - снимок JSON, иначе Prometheus"""
+        content = self.to_json() if path.endswith(".json") else self.to_prometheus()
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(content)
+
+# Общие метрики процесса
+CLIENT_METRICS = ClientMetrics()
@@ -0,0 +1,240 @@
+# server.py
+"""
+Локальный сервер ассистента: несколько устройств работают через один шлюз.
+
+POST /ask  {"query": "...", "priority": "voice|interactive|background"}
+Заголовок X-Client-Id задает клиента (иначе берется адрес соединения).
+Ответ: {"ok": true, "response": "...", "error": null, "status_code": 200,
+        "prompt_tokens": ..., "completion_tokens": ..., "latency": ..., "retries": ...}
+При ошибке модели возвращается 429 (лимит запросов) или 502.
+GET /metrics - метрики клиента OpenRouter в формате Prometheus
+"""
+import sys
+import json
+import asyncio
+import itertools
+from config import SERVER_CONFIG
+from text import AIResult, request_ai_response
+from metrics import CLIENT_METRICS
+
+class AssistantServer:
+    """
+    Очередь запросов к модели с приоритетами, лимитом на клиента,
+    объединением одинаковых запросов и необязательным микробатчингом
+    """
+
+    def __init__(self, backend=request_ai_response, batch_backend=None, config=None):
+        self.backend = backend  # str -> AIResult (или str)
+        self.batch_backend = batch_backend  # list[str] -> list[AIResult или str]
+        self.config = dict(SERVER_CONFIG, **(config or {}))
+        self.queue = None
+        self.in_flight = {}  # запрос -> задача {"future", "level", "started"}
+        self.client_limits = {}  # клиент -> {"semaphore", "users"}, пока есть запросы
+        self.counter = itertools.count()  # Порядок внутри одного приоритета
+        self.workers = []
+        self.server = None
+
+    async def start(self):
+        """Запустить обработчиков очереди и HTTP-сервер"""
+        self.queue = asyncio.PriorityQueue()
+        self.workers = [asyncio.create_task(self._worker()) for _ in range(self.config["workers"])]
+        self.server = await asyncio.start_server(
+            self._handle_connection, self.config["host"], self.config["port"]
+        )
+        return self.server
+
+    async def stop(self):
+        """Остановить сервер и обработчиков"""
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+
+    async def ask(self, query: str, priority="interactive", client_id="local") -> AIResult:
+        """Поставить запрос в очередь и дождаться ответа"""
+        limit = self.client_limits.get(client_id)
+        if limit is None:
+            limit = {"semaphore": asyncio.Semaphore(self.config["per_client_limit"]), "users": 0}
+            self.client_limits[client_id] = limit
+        limit["users"] += 1
+
+        level = self.config["priorities"].get(priority, self.config["priorities"]["interactive"])
+        try:
+            async with limit["semaphore"]:
+                # Одинаковый запрос уже в очереди - ждем его результат
+                job = self.in_flight.get(query)
+                if job is None:
+                    job = {"future": asyncio.get_running_loop().create_future(), "level": level, "started": False}
+                    self.in_flight[query] = job
+                    await self.queue.put((level, next(self.counter), query, job))
+                elif level < job["level"] and not job["started"]:
+                    # Повышаем приоритет: лишняя запись в очереди будет пропущена
+                    job["level"] = level
+                    await self.queue.put((level, next(self.counter), query, job))
+                return await asyncio.shield(job["future"])
+        finally:
+            # Клиент без активных запросов больше не занимает память
+            limit["users"] -= 1
+            if limit["users"] == 0:
+                del self.client_limits[client_id]
+
+    async def _next_job(self, timeout=None):
+        """Взять из очереди следующий еще не запущенный запрос"""
+        while True:
+            if timeout is None:
+                _, _, query, job = await self.queue.get()
+            else:
+                _, _, query, job = await asyncio.wait_for(self.queue.get(), timeout)
+            if not job["started"]:
+                job["started"] = True
+                return query, job
+
+    async def _worker(self):
+        """Забирать запросы из очереди и отправлять в модель"""
+        loop = asyncio.get_running_loop()
+        while True:
+            query, job = await self._next_job()
+            queries, jobs = [query], [job]
+            if self.batch_backend and self.config["batch_size"] > 1:
+                await self._fill_batch(queries, jobs)
+
+            try:
+                if len(queries) > 1:
+                    responses = await loop.run_in_executor(None, self.batch_backend, queries)
+                else:
+                    responses = [await loop.run_in_executor(None, self.backend, queries[0])]
+            except Exception as e:
+                responses = [self._error_result(f"Ошибка: {str(e)}")] * len(queries)
+
+            # Бэкенд обязан ответить на каждый запрос батча
+            if len(responses) != len(queries):
+                error = f"Ошибка: бэкенд вернул {len(responses)} ответов на {len(queries)} запросов"
+                responses = [self._error_result(error)] * len(queries)
+
+            for query, job, response in zip(queries, jobs, responses):
+                if self.in_flight.get(query) is job:
+                    del self.in_flight[query]
+                if not job["future"].done():
+                    job["future"].set_result(self._as_result(response))
+
+    def _as_result(self, response):
+        """Привести ответ бэкенда к AIResult (простые бэкенды отдают строку)"""
+        if isinstance(response, AIResult):
+            return response
+        result = AIResult(None)
+        result.text = response
+        return result
+
+    def _error_result(self, error):
+        result = AIResult(None)
+        result.error = error
+        return result
+
+    async def _fill_batch(self, queries, jobs):
+        """Добрать батч из очереди, подождав не дольше batch_wait"""
+        deadline = asyncio.get_running_loop().time() + self.config["batch_wait"]
+        while len(queries) < self.config["batch_size"]:
+            timeout = deadline - asyncio.get_running_loop().time()
+            if timeout <= 0:
+                break
+            try:
+                query, job = await self._next_job(timeout)
+            except asyncio.TimeoutError:
+                break
+            queries.append(query)
+            jobs.append(job)
+
+    async def _handle_connection(self, reader, writer):
+        """Обработать один HTTP-запрос"""
+        try:
+            request_line = (await reader.readline()).decode("latin-1").split()
+            headers = {}
+            while True:
+                line = (await reader.readline()).decode("latin-1").strip()
+                if not line:
+                    break
+                name, _, value = line.partition(":")
+                headers[name.strip().lower()] = value.strip()
+
+            if request_line[:2] == ["GET", "/metrics"]:
+                await self._send(writer, 200, CLIENT_METRICS.to_prometheus())
+                return
+
+            if len(request_line) < 2 or request_line[0] != "POST" or request_line[1] != "/ask":
+                await self._send(writer, 404, {"error": "Используйте POST /ask"})
+                return
+
+            try:
+                length = int(headers.get("content-length", 0))
+            except ValueError:
+                length = -1
+            if length < 0:
+                await self._send(writer, 400, {"error": "Некорректный Content-Length"})
+                return
+
+            body = await reader.readexactly(length)
+            try:
+                data = json.loads(body or b"{}")
+            except ValueError:
+                data = {}
+            if not isinstance(data, dict) or not isinstance(data.get("query"), str) or not data["query"]:
+                await self._send(writer, 400, {"error": "Ожидается JSON-объект со строкой query"})
+                return
+
+            client_id = headers.get("x-client-id") or writer.get_extra_info("peername", ("local",))[0]
+            priority = data.get("priority")
+            if not isinstance(priority, str):
+                priority = "interactive"
+            result = await self.ask(data["query"], priority, client_id)
+            if result.ok:
+                status = 200
+            else:
+                status = 429 if result.status_code == 429 else 502
+            await self._send(writer, status, {
+                "ok": result.ok,
+                "response": result.text if result.ok else None,
+                "error": result.error,
+                "status_code": result.status_code,
+                "prompt_tokens": result.prompt_tokens,
+                "completion_tokens": result.completion_tokens,
+                "latency": result.latency,
+                "retries": result.retries
+            })
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def _send(self, writer, status, payload):
+        """Отправить JSON-ответ (строка отправляется как обычный текст)"""
+        if isinstance(payload, str):
+            body = payload.encode("utf-8")
+            content_type = "text/plain; version=0.0.4"
+        else:
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            content_type = "application/json"
+        reason = {200: "OK", 400: "Bad Request", 404: "Not Found",
+                  429: "Too Many Requests", 502: "Bad Gateway"}[status]
+        writer.write(
+            f"HTTP/1.1 {status} {reason}\r\n"
+            f"Content-Type: {content_type}; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: close\r\n\r\n".encode("latin-1") + body
+        )
+        await writer.drain()
+
+async def serve():
+    """Запустить сервер до прерывания"""
+    assistant = AssistantServer()
+    server = await assistant.start()
+    print(f"Сервер ассистента: http://{SERVER_CONFIG['host']}:{SERVER_CONFIG['port']}/ask", file=sys.stderr)
+    async with server:
+        await server.serve_forever()
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
@@ -1,41 +1,460 @@
 # text.py
+import re
 import sys
+import json
+import time
+import wave
+import queue
+import threading
 import requests
-from config import MODEL_CONFIG, SYSTEM_PROMPT
+from config import MODEL_CONFIG, SYSTEM_PROMPT, VOICE_CONFIG
+from metrics import CLIENT_METRICS
+
+# Знаки конца предложения и границы частей предложения
+SENTENCE_END = ".!?…"
+CLAUSE_END = ",;:—"
+CLOSING_MARKS = "»\")]"
+
+# Сокращения, после точки в которых предложение обычно не заканчивается
+ABBREVIATIONS = {
+    "т", "е", "д", "п", "к", "т.е", "т.д", "т.п", "т.к", "др", "пр", "г", "гг",
+    "в", "вв", "ул", "кв", "им", "см", "стр", "рис", "руб", "коп", "тыс",
+    "млн", "млрд", "проф", "акад", "н.э", "etc", "e.g", "i.e", "mr", "mrs",
+    "dr", "vs"
+}
+
+# Инициал: одна заглавная буква с точкой ("А. С. Пушкин")
+INITIAL_RE = re.compile(r"[A-ZА-ЯЁ]\.(\s|$)")
+PREVIOUS_INITIAL_RE = re.compile(r"(^|\s)[A-ZА-ЯЁ]\.\s*$")
+
+class AIStreamError(Exception):
+    """Ошибка потокового запроса к модели (HTTP или внутри SSE-потока)"""
+
+# Заголовки OpenRouter с остатком лимита запросов
+RATE_LIMIT_HEADERS = ("X-RateLimit-Limit", "X-RateLimit-Remaining", "X-RateLimit-Reset")
+
+class AIResult:
+    """Результат запроса к модели с текстом ответа и метриками"""
+
+    def __init__(self, model):
+        self.model = model
+        self.text = ""
+        self.error = None  # Текст ошибки, если запрос не удался
+        self.status_code = None
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        # Время от начала запроса до заголовков первого ответа (до повторов;
+        # в потоке - до первого текста), секунды. latency включает повторы и паузы
+        self.ttfb = None
+        self.latency = 0.0
+        self.retries = 0
+        self.rate_limit = {}
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def __str__(self):
+        return self.text if self.ok else self.error
+
+def _build_payload(user_query: str, stream: bool = False) -> dict:
+    """Собрать тело запроса к OpenRouter"""
+    payload = {
+        "model": MODEL_CONFIG["model"],
+        "messages": [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": user_query}
+        ],
+        "temperature": MODEL_CONFIG["temperature"],
+        "max_tokens": MODEL_CONFIG["max_tokens"]
+    }
+    if stream:
+        payload["stream"] = True
+        # Попросить usage в последнем сообщении потока
+        payload["stream_options"] = {"include_usage": True}
+    return payload
+
+def _read_rate_limit(headers) -> dict:
+    """Достать числовые заголовки лимита запросов"""
+    rate_limit = {}
+    for header in RATE_LIMIT_HEADERS:
+        try:
+            rate_limit[header.lower()] = float(headers[header])
+        except (KeyError, TypeError, ValueError):
+            pass
+    return rate_limit
+
+def request_ai_response(user_query: str) -> AIResult:
+    """
+    Получает ответ от модели через OpenRouter API вместе с метриками:
+    токены, время до первого байта, задержка, повторы, лимиты
+    """
+    result = AIResult(MODEL_CONFIG["model"])
+    started = time.perf_counter()
+
+    try:
+        for attempt in range(MODEL_CONFIG.get("retries", 0) + 1):
+            result.retries = attempt
+            response = requests.post(
+                url=MODEL_CONFIG["api_url"],
+                headers=MODEL_CONFIG["headers"],
+                json=_build_payload(user_query),
+                timeout=30
+            )
+            result.status_code = response.status_code
+            if result.ttfb is None:
+                result.ttfb = response.elapsed.total_seconds()
+            result.rate_limit = _read_rate_limit(response.headers)
+
+            # При 429 и 5xx повторяем с паузой (Retry-After, если есть)
+            if response.status_code != 429 and response.status_code < 500:
+                break
+            if attempt < MODEL_CONFIG.get("retries", 0):
+                try:
+                    delay = float(response.headers.get("Retry-After", 2 ** attempt))
+                except ValueError:
+                    delay = 2 ** attempt
+                delay = max(0.0, delay)
+                # Слишком долгое ожидание не ждем - отдаем ошибку сразу
+                if delay > MODEL_CONFIG.get("max_retry_wait", 10):
+                    break
+                time.sleep(delay)
+
+        response.raise_for_status()
+        data = response.json()
+        result.text = data["choices"][0]["message"]["content"].strip()
+        usage = data.get("usage") or {}
+        result.prompt_tokens = usage.get("prompt_tokens") or 0
+        result.completion_tokens = usage.get("completion_tokens") or 0
+
+    except requests.exceptions.HTTPError as err:
+        if hasattr(err, 'response') and err.response.status_code == 429:
+            result.error = "Ошибка: Слишком много запросов (лимит Rate Limit)"
+        else:
+            result.error = f"HTTP ошибка: {err}"
+    except Exception as e:
+        result.error = f"Ошибка: {str(e)}"
+
+    result.latency = time.perf_counter() - started
+    CLIENT_METRICS.record(result)
+    return result
 
 def get_ai_response(user_query: str) -> str:
     """
-    Получает ответ от модели через OpenRouter API
+    Получает ответ от модели через OpenRouter API.
+    Текст ответа или ошибки; подробности - в request_ai_response()
+    """
+    return str(request_ai_response(user_query))
+
+def stream_ai_response(user_query: str):
+    """
+    Получает ответ модели по частям (SSE-поток OpenRouter).
+    Ошибки не смешиваются с текстом ответа: бросается AIStreamError
+    с тем же текстом, что и в get_ai_response().
+    Метрики записываются в CLIENT_METRICS, как в request_ai_response()
     """
-    # Check if we should use mock mode for testing (when API key is invalid)
+    result = AIResult(MODEL_CONFIG["model"])
+    started = time.perf_counter()
 
     try:
-        response = requests.post(
+        with requests.post(
             url=MODEL_CONFIG["api_url"],
             headers=MODEL_CONFIG["headers"],
-            json={
-                "model": MODEL_CONFIG["model"],
-                "messages": [
-                    {"role": "system", "content": SYSTEM_PROMPT},
-                    {"role": "user", "content": user_query}
-                ],
-                "temperature": MODEL_CONFIG["temperature"],
-                "max_tokens": MODEL_CONFIG["max_tokens"]
-            },
-            timeout=30
-        )
-        response.raise_for_status()
-        return response.json()["choices"][0]["message"]["content"].strip()
+            json=_build_payload(user_query, stream=True),
+            timeout=30,
+            stream=True
+        ) as response:
+            result.status_code = response.status_code
+            result.rate_limit = _read_rate_limit(response.headers)
+            response.raise_for_status()
+            for line in response.iter_lines(decode_unicode=True):
+                # Пропускаем пустые строки и комментарии keep-alive
+                if not line or not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                chunk = json.loads(data)
+                # Ошибка посреди потока приходит отдельным сообщением
+                if "error" in chunk:
+                    error = chunk["error"]
+                    message = error.get("message", error) if isinstance(error, dict) else error
+                    raise AIStreamError(f"Ошибка: {message}")
+                # usage приходит в последнем сообщении (stream_options)
+                usage = chunk.get("usage") or {}
+                if usage:
+                    result.prompt_tokens = usage.get("prompt_tokens") or 0
+                    result.completion_tokens = usage.get("completion_tokens") or 0
+                choices = chunk.get("choices") or [{}]
+                delta = choices[0].get("delta", {}).get("content")
+                if delta:
+                    if result.ttfb is None:
+                        result.ttfb = time.perf_counter() - started
+                    yield delta
 
+    except AIStreamError as e:
+        result.error = str(e)
+        raise
     except requests.exceptions.HTTPError as err:
         if hasattr(err, 'response') and err.response.status_code == 429:
-            return "Ошибка: Слишком много запросов (лимит Rate Limit)"
-        return f"HTTP ошибка: {err}"
+            result.error = "Ошибка: Слишком много запросов (лимит Rate Limit)"
+        else:
+            result.error = f"HTTP ошибка: {err}"
+        raise AIStreamError(result.error) from err
     except Exception as e:
-        return f"Ошибка: {str(e)}"
+        result.error = f"Ошибка: {str(e)}"
+        raise AIStreamError(result.error) from e
+    finally:
+        # Срабатывает и при досрочном закрытии генератора
+        result.latency = time.perf_counter() - started
+        CLIENT_METRICS.record(result)
+
+class SentenceChunker:
+    """
+    Режет поступающий по частям текст на предложения и части предложений.
+    Граница фиксируется только когда виден следующий символ, поэтому
+    "т.д." или "3.14" в середине потока не разрываются
+    """
+
+    def __init__(self, min_clause_length=None, max_chunk_length=None):
+        self.min_clause_length = min_clause_length or VOICE_CONFIG["min_clause_length"]
+        self.max_chunk_length = max_chunk_length or VOICE_CONFIG["max_chunk_length"]
+        self.reset()
+
+    def reset(self):
+        """Забыть недоговоренный фрагмент (перед новым ответом)"""
+        self.buffer = ""
+        self.at_line_start = True  # Буфер начинается с новой строки
+
+    def feed(self, text: str) -> list:
+        """Добавить текст и вернуть готовые фрагменты"""
+        self.buffer += text
+        chunks = []
+        while True:
+            end = self._find_boundary()
+            if end is None:
+                break
+            chunk = self.buffer[:end].strip()
+            rest = self.buffer[end:]
+            self.buffer = rest.lstrip()
+            self.at_line_start = "\n" in rest[:len(rest) - len(self.buffer)]
+            if chunk:
+                chunks.append(chunk)
+        return chunks
+
+    def flush(self) -> list:
+        """Отдать остаток текста в конце потока"""
+        chunk = self.buffer.strip()
+        self.buffer = ""
+        return [chunk] if chunk else []
+
+    def _find_boundary(self):
+        """Найти конец первого готового фрагмента в буфере"""
+        buffer = self.buffer
+        for i, char in enumerate(buffer):
+            # Перевод строки всегда завершает фрагмент (заголовки, пункты списков)
+            if char == "\n":
+                return i
+            if char not in SENTENCE_END and char not in CLAUSE_END:
+                continue
+
+            # Захватываем серии знаков ("?!", "...") и закрывающие кавычки
+            end = i + 1
+            while end < len(buffer) and (buffer[end] in SENTENCE_END or buffer[end] in CLOSING_MARKS):
+                end += 1
+            if end >= len(buffer):
+                return None  # Ждем следующий символ
+            if not buffer[end].isspace():
+                continue
+
+            if char in CLAUSE_END:
+                if end >= self.min_clause_length:
+                    return end
+                continue
+
+            if char == ".":
+                is_end = self._is_sentence_dot(buffer, i, end)
+                if is_end is None:
+                    return None  # Ждем следующее слово
+                if not is_end:
+                    continue
+            return end
+
+        # Слишком длинный фрагмент без знаков режем по последнему пробелу
+        if len(buffer) > self.max_chunk_length:
+            cut = buffer.rfind(" ", 0, self.max_chunk_length)
+            return cut if cut > 0 else self.max_chunk_length
+        return None
+
+    def _is_sentence_dot(self, buffer, dot, end):
+        """Проверить, что точка завершает предложение, а не сокращение"""
+        word_start = max(buffer.rfind(" ", 0, dot), buffer.rfind("\n", 0, dot)) + 1
+        word = buffer[word_start:dot].strip("«\"(")
+
+        # Номер пункта списка в начале строки: "1. Первое"
+        if word.isdigit() and word_start == 0 and self.at_line_start:
+            return False
+
+        # Инициалы: "А. С. Пушкин". Одиночная буква без соседнего
+        # инициала - это предложение из одного слова: "Я. Ты."
+        if len(word) == 1 and word.isupper():
+            if PREVIOUS_INITIAL_RE.search(buffer[:word_start]):
+                return False
+            rest = buffer[end:].lstrip()
+            if len(rest) < 2:
+                return None  # Ждем следующее слово
+            return not INITIAL_RE.match(rest)
+
+        if word.lower() in ABBREVIATIONS:
+            # После сокращения предложение кончается, только если дальше заглавная
+            rest = buffer[end:].lstrip()
+            if not rest:
+                return None  # Ждем следующее слово
+            return rest[0].isupper()
+        return True
+
+class NullSink:
+    """Приемник речи для тестов: только запоминает фрагменты"""
+
+    def __init__(self):
+        self.chunks = []
+
+    def speak(self, text: str):
+        self.chunks.append(text)
+
+    def close(self):
+        pass
+
+class WavFileSink:
+    """
+    Приемник речи, пишущий звук в WAV-файл.
+    synthesize(text) -> bytes должен возвращать 16-битный моно PCM;
+    по умолчанию пишется тишина длиной по числу символов
+    """
+
+    def __init__(self, path: str, synthesize=None, sample_rate=None):
+        self.sample_rate = sample_rate or VOICE_CONFIG["sample_rate"]
+        self.synthesize = synthesize or self._silence
+        self.chunks = []
+        self._file = wave.open(path, "wb")
+        self._file.setnchannels(1)
+        self._file.setsampwidth(2)
+        self._file.setframerate(self.sample_rate)
+
+    def _silence(self, text: str) -> bytes:
+        # Примерно 60 мс на символ
+        frames = int(self.sample_rate * 0.06 * len(text))
+        return b"\x00\x00" * frames
+
+    def speak(self, text: str):
+        self.chunks.append(text)
+        self._file.writeframes(self.synthesize(text))
+
+    def close(self):
+        self._file.close()
+
+class SpeechPipeline:
+    """
+    Потоковая озвучка: текст модели режется на фрагменты, которые через
+    ограниченную очередь уходят в приемник речи в отдельном потоке.
+    Первый фрагмент начинает звучать, пока модель еще генерирует ответ
+    """
+
+    def __init__(self, sink, chunker=None, queue_size=None):
+        self.sink = sink
+        self.chunker = chunker or SentenceChunker()
+        self.queue = queue.Queue(maxsize=queue_size or VOICE_CONFIG["queue_size"])
+        self.stats = {}
+        self.sink_error = None
+
+    def _worker(self):
+        """Забирать фрагменты из очереди и передавать приемнику"""
+        while True:
+            chunk = self.queue.get()
+            if chunk is None:
+                break
+            # После ошибки приемника только разгружаем очередь до None,
+            # чтобы производитель не заблокировался на put()
+            if self.sink_error:
+                continue
+            if "first_chunk_spoken" not in self.stats:
+                self.stats["first_chunk_spoken"] = time.perf_counter() - self._started
+            try:
+                self.sink.speak(chunk)
+            except Exception as e:
+                self.sink_error = e
+                self.stats["error"] = f"Ошибка синтеза речи: {e}"
+
+    def _put(self, chunk):
+        if "first_chunk_ready" not in self.stats:
+            self.stats["first_chunk_ready"] = time.perf_counter() - self._started
+        self.stats["chunks"] += 1
+        self.queue.put(chunk)  # Блокируется, если синтез не успевает
+
+    def run(self, deltas) -> str:
+        """
+        Озвучить поток текста и вернуть полный ответ.
+        Ошибка модели (AIStreamError) или приемника речи останавливает
+        озвучку, попадает в stats["error"] и пробрасывается дальше
+        """
+        self._started = time.perf_counter()
+        self.stats = {"chunks": 0}
+        self.sink_error = None
+        self.chunker.reset()
+        worker = threading.Thread(target=self._worker, daemon=True)
+        worker.start()
+
+        parts = []
+        try:
+            for delta in deltas:
+                if self.sink_error:
+                    break
+                parts.append(delta)
+                for chunk in self.chunker.feed(delta):
+                    self._put(chunk)
+            else:
+                for chunk in self.chunker.flush():
+                    self._put(chunk)
+        except AIStreamError as e:
+            self.stats["error"] = str(e)
+            raise
+        finally:
+            # Закрываем генератор сразу, чтобы освободить HTTP-соединение
+            if hasattr(deltas, "close"):
+                deltas.close()
+            self.queue.put(None)
+            worker.join()
+            self.stats["total"] = time.perf_counter() - self._started
+
+        if self.sink_error:
+            raise self.sink_error
+        return "".join(parts).strip()
+
+def speak_ai_response(user_query: str, sink) -> tuple:
+    """Получить ответ модели с потоковой озвучкой; вернуть текст и статистику"""
+    pipeline = SpeechPipeline(sink)
+    try:
+        text = pipeline.run(stream_ai_response(user_query))
+    finally:
+        sink.close()
+    return text, pipeline.stats
 
 if __name__ == "__main__":
     user_input = input()
 
-    response = get_ai_response(user_input)
-    print(response)
+    # Озвучка в файл: python text.py --wav answer.wav
+    if len(sys.argv) == 3 and sys.argv[1] == "--wav":
+        try:
+            response, stats = speak_ai_response(user_input, WavFileSink(sys.argv[2]))
+        except AIStreamError as e:
+            print(e)
+        else:
+            print(response)
+            print(f"Первый фрагмент через {stats.get('first_chunk_ready', 0):.2f} с", file=sys.stderr)
+    # Выгрузка метрик: python text.py --metrics metrics.prom (или .json)
+    elif len(sys.argv) == 3 and sys.argv[1] == "--metrics":
+        print(request_ai_response(user_input))
+        CLIENT_METRICS.export(sys.argv[2])
+    else:
+        response = get_ai_response(user_input)
+        print(response)